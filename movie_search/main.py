@@ -6,8 +6,10 @@ from dotenv import load_dotenv
 import asyncio
 
 # Import our custom modules
-from search_engine import search_movie, test_site_connectivity
+from search_engine import search_movie, test_site_connectivity, pattern_stats, get_bandwidth_stats
 from sites_config import list_sites, enable_site, disable_site
+from prefetch import PrefetchCrawler
+from profiler import SearchProfiler, MAX_PROFILE_SEARCHES
 
 # Configure logging
 logging.basicConfig(
@@ -23,6 +25,12 @@ TOKEN = os.getenv('TELEGRAM_BOT_TOKEN')
 CHANNEL_ID = os.getenv('CHANNEL_ID')
 ADMIN_IDS = os.getenv('ADMIN_IDS', '').split(',')
 
+# Background crawler that keeps popular queries warm in the cache
+prefetcher = PrefetchCrawler()
+
+# On-demand profiler for the next N searches (/profile)
+search_profiler = SearchProfiler()
+
 # All search functions are now in search_engine.py module
 
 async def handle_search(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -44,7 +52,14 @@ async def handle_search(update: Update, context: ContextTypes.DEFAULT_TYPE):
     status_message = await update.message.reply_text(f"🔍 Ищу '{query}'...")
     
     try:
-        results = await search_movie(query)
+        prefetcher.record_query(query)
+        async with prefetcher.interactive():
+            if search_profiler.active:
+                results = await search_profiler.profile_search(query, search_movie)
+            else:
+                results = await search_movie(query)
+        
+        await send_profile_report(context)
         
         if not results:
             await status_message.edit_text("😕 Ничего не найдено.")
@@ -118,6 +133,7 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
 /search <запрос> - Поиск фильмов
 /sites - Показать статус сайтов
 /status - Проверить подключение к сайтам
+/profile <n> - Профилировать следующие n поисков (/profile off - отменить)
 /help - Показать эту справку
 
 *Или просто отправьте название фильма/сериала для поиска.*
@@ -156,12 +172,63 @@ async def status_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
             for site, status in connectivity_results.items():
                 message += f"• {site}: {status}\n"
             
+            bandwidth_stats = get_bandwidth_stats()
+            if bandwidth_stats:
+                message += "\n📦 *Трафик поисковых запросов (сжато / распаковано):*\n\n"
+                for site, stats in bandwidth_stats.items():
+                    message += (f"• {site}: {stats['compressed_bytes'] // 1024} KB / "
+                                f"{stats['uncompressed_bytes'] // 1024} KB ({stats['responses']} ответов)\n")
+            
             await status_message.edit_text(message, parse_mode='Markdown')
         except Exception as e:
             await status_message.edit_text(f"❌ Ошибка при проверке статуса: {str(e)}")
     else:
         await update.message.reply_text("❌ У вас нет доступа к этому боту.")
 
+async def profile_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Handle /profile command."""
+    # Check if message is from a user (not from channel/group)
+    if not update.effective_user:
+        await update.message.reply_text("❌ Эта команда доступна только в личных сообщениях.")
+        return
+    
+    if str(update.effective_user.id) in ADMIN_IDS:
+        if context.args and context.args[0].lower() in ('off', '0'):
+            search_profiler.cancel()
+            await update.message.reply_text("📊 Профилирование отключено.")
+            return
+        
+        try:
+            searches = int(context.args[0]) if context.args else 1
+        except ValueError:
+            searches = 0
+        
+        if not 1 <= searches <= MAX_PROFILE_SEARCHES:
+            await update.message.reply_text(f"⚠️ Использование: /profile <n>, где n от 1 до {MAX_PROFILE_SEARCHES}, или /profile off.")
+            return
+        
+        search_profiler.enable(searches, update.effective_chat.id)
+        await update.message.reply_text(f"📊 Профилирование включено для следующих {searches} поисков.")
+    else:
+        await update.message.reply_text("❌ У вас нет доступа к этому боту.")
+
+async def send_profile_report(context: ContextTypes.DEFAULT_TYPE):
+    """Send a finished profiling report to the admin who requested it."""
+    report = search_profiler.take_report()
+    if not report:
+        return
+    
+    filename, content = report
+    try:
+        await context.bot.send_document(
+            chat_id=search_profiler.chat_id,
+            document=content,
+            filename=filename,
+            caption=f"📊 Отчёт профилирования (pstats сохранены в {search_profiler.output_dir}/)"
+        )
+    except Exception as e:
+        logging.error(f"Failed to send profile report: {str(e)}")
+
 def main():
     """Start the bot."""
     if not all([TOKEN, CHANNEL_ID]):
@@ -177,6 +244,7 @@ def main():
         application.add_handler(CommandHandler("help", help_command))
         application.add_handler(CommandHandler("sites", sites_command))
         application.add_handler(CommandHandler("status", status_command))
+        application.add_handler(CommandHandler("profile", profile_command))
         application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_search))
 
         logging.info("Starting bot...")
@@ -199,6 +267,9 @@ def main():
             await application.start()
             await application.updater.start_polling()
             
+            # Start background prefetching of popular queries
+            prefetcher.start()
+            
             # Keep the application running
             while True:
                 try:
@@ -207,6 +278,8 @@ def main():
                     break
 
             # Cleanup
+            await prefetcher.stop()
+            pattern_stats.save(force=True)
             await application.stop()
 
         # Run everything in asyncio
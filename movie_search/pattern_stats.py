@@ -0,0 +1,210 @@
+"""
+Search pattern statistics for the Telegram bot.
+Learns which (site, URL pattern, query encoding) combinations actually work
+and orders search candidates so the best combination is tried first.
+"""
+
+import logging
+import json
+import os
+import random
+import time
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Constants
+PATTERN_STATS_FILE = 'pattern_stats.json'
+PRUNE_AFTER_FAILURES = 5  # consecutive fetch failures (or dead pages) before a variant is pruned
+EXPLORATION_RATE = 0.1  # chance to retry a pruned variant or look past a trusted empty answer
+TRUSTED_MIN_HITS = 3  # hits before a variant's empty answer is trusted
+SAVE_INTERVAL = 60  # seconds between writes to disk
+LATENCY_SMOOTHING = 0.3  # weight of the newest sample in the latency average
+HIT_RATE_SMOOTHING = 0.2  # weight of the newest fetched page in the hit rate average
+
+# Statistics of a combination that was never tried
+DEFAULT_ENTRY = {
+    'attempts': 0,
+    'successes': 0,
+    'hits': 0,
+    'results': 0,
+    'consecutive_failures': 0,
+    'misses': 0,
+    'hit_rate': 0.0,
+    'latency': 0.0,
+}
+
+class PatternStats:
+    """Per-(site, pattern, encoding) success, yield and latency statistics."""
+
+    def __init__(self, path: str = PATTERN_STATS_FILE):
+        self.path = path
+        # site -> "pattern|encoding" -> stats dict
+        self.stats: dict[str, dict[str, dict]] = {}
+        self._dirty = False
+        self._last_save = 0.0
+        self.load()
+
+    @staticmethod
+    def make_key(pattern: str, encoding: str) -> str:
+        """Build the storage key for a pattern/encoding combination."""
+        return f"{pattern}|{encoding}"
+
+    def get(self, site_name: str, pattern: str, encoding: str) -> dict:
+        """Get a copy of the statistics for a combination without storing anything."""
+        entry = self.stats.get(site_name, {}).get(self.make_key(pattern, encoding), {})
+        return {**DEFAULT_ENTRY, **entry}
+
+    def _entry(self, site_name: str, pattern: str, encoding: str) -> dict:
+        """Get the stored statistics entry for a combination, creating it if needed."""
+        site_stats = self.stats.setdefault(site_name, {})
+        entry = site_stats.setdefault(self.make_key(pattern, encoding), {})
+        # Entries saved by older versions may lack newer fields
+        for key, value in DEFAULT_ENTRY.items():
+            entry.setdefault(key, value)
+        return entry
+
+    def record(self, site_name: str, pattern: str, encoding: str, success: bool, result_count: int, latency: float):
+        """
+        Record the outcome of a search request.
+        success means the page was fetched, result_count is how many matches it yielded.
+        """
+        entry = self._entry(site_name, pattern, encoding)
+        entry['attempts'] += 1
+        if success:
+            entry['successes'] += 1
+            entry['results'] += result_count
+            found = 1.0 if result_count > 0 else 0.0
+            entry['hit_rate'] = (1 - HIT_RATE_SMOOTHING) * entry['hit_rate'] + HIT_RATE_SMOOTHING * found
+        if not success:
+            entry['consecutive_failures'] += 1
+        elif result_count > 0:
+            entry['hits'] += 1
+            entry['consecutive_failures'] = 0
+            entry['misses'] = 0
+        elif entry['hits'] == 0 and self.site_has_hits(site_name):
+            # Another variant finds titles on this site, so an empty page here
+            # means this variant is dead rather than the title being missing
+            entry['consecutive_failures'] += 1
+        else:
+            # The page was fetched, the title is simply not on this site
+            entry['consecutive_failures'] = 0
+        if entry['latency']:
+            entry['latency'] = (1 - LATENCY_SMOOTHING) * entry['latency'] + LATENCY_SMOOTHING * latency
+        else:
+            entry['latency'] = latency
+        self._dirty = True
+
+    def record_miss(self, site_name: str, pattern: str, encoding: str):
+        """
+        Record that a combination returned an empty page for a title that a
+        lower ranked combination then found on the same site. A proven
+        combination that keeps missing has likely gone stale after a mirror
+        changed its search URL, so it loses trust and is demoted.
+        """
+        entry = self.stats.get(site_name, {}).get(self.make_key(pattern, encoding))
+        if entry is None or entry['hits'] == 0:
+            # Combinations without hits are already handled by record()
+            return
+        entry['misses'] = entry.get('misses', 0) + 1
+        self._dirty = True
+
+    def site_has_hits(self, site_name: str) -> bool:
+        """Check whether any variant has ever found results on a site."""
+        return any(entry['hits'] > 0 for entry in self.stats.get(site_name, {}).values())
+
+    @staticmethod
+    def rank(entry: dict) -> tuple:
+        """
+        Sort key for a combination, lower is better.
+        Combinations that ever found results come first: those not missing titles
+        found elsewhere before those that do, then by recent hit rate. The rest
+        are ordered by how often they failed in a row.
+        """
+        if entry['hits'] > 0:
+            return (0, entry['misses'] > 0, -entry['hit_rate'], entry['latency'])
+        return (1, entry['consecutive_failures'], 0.0, entry['latency'])
+
+    def is_pruned(self, entry: dict) -> bool:
+        """Check whether a combination keeps failing to fetch and should normally be skipped."""
+        return entry['hits'] == 0 and entry['consecutive_failures'] >= PRUNE_AFTER_FAILURES
+
+    def is_trusted(self, site_name: str, pattern: str, encoding: str) -> bool:
+        """Check whether a combination is proven, so an empty result from it means 'not found'."""
+        entry = self.get(site_name, pattern, encoding)
+        return (entry['hits'] >= TRUSTED_MIN_HITS and entry['consecutive_failures'] == 0
+                and entry['misses'] == 0)
+
+    def should_stop(self, site_name: str, pattern: str, encoding: str, success: bool,
+                    result_count: int, exploring: bool) -> bool:
+        """Decide whether a site search can stop after trying this combination."""
+        if result_count > 0:
+            return True
+        # An empty answer from a proven combination means the title is not on this site
+        return success and not exploring and self.is_trusted(site_name, pattern, encoding)
+
+    @staticmethod
+    def should_explore() -> bool:
+        """Randomly decide to look past the usual best candidate to notice drift."""
+        return random.random() < EXPLORATION_RATE
+
+    def order_candidates(self, site_name: str, candidates: list[tuple[str, str, str]]) -> list[tuple[str, str, str]]:
+        """
+        Order (pattern, encoding, query_variant) candidates best first.
+        Pruned candidates are dropped, except for occasional exploration so
+        that a mirror changing its search URL is still noticed. If every
+        candidate is pruned, all of them are kept. Statistics for combinations
+        no longer in the site's configuration are dropped.
+        """
+        current_keys = {self.make_key(pattern, encoding) for pattern, encoding, _ in candidates}
+        site_stats = self.stats.get(site_name, {})
+        for key in [key for key in site_stats if key not in current_keys]:
+            del site_stats[key]
+            self._dirty = True
+
+        scored = []
+        pruned = []
+        for index, candidate in enumerate(candidates):
+            pattern, encoding, _ = candidate
+            entry = self.get(site_name, pattern, encoding)
+            # Ties keep the configuration order
+            item = (self.rank(entry), index, candidate)
+            if self.is_pruned(entry):
+                pruned.append(item)
+            else:
+                scored.append(item)
+        if not scored:
+            # Never leave a site without anything to try
+            scored = pruned
+        else:
+            scored.extend(item for item in pruned if self.should_explore())
+        scored.sort()
+        return [candidate for _, _, candidate in scored]
+
+    def load(self):
+        """Load statistics from disk if the file exists."""
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                self.stats = json.load(f)
+            logger.info(f"Loaded search pattern statistics for {len(self.stats)} sites from {self.path}")
+        except Exception as e:
+            logger.error(f"Failed to load search pattern statistics from {self.path}: {str(e)}")
+            self.stats = {}
+
+    def save(self, force: bool = False):
+        """Persist statistics to disk, at most once per SAVE_INTERVAL unless forced."""
+        if not self._dirty:
+            return
+        if not force and time.monotonic() - self._last_save < SAVE_INTERVAL:
+            return
+        try:
+            tmp_path = self.path + '.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(self.stats, f, ensure_ascii=False, indent=2)
+            os.replace(tmp_path, self.path)
+            self._dirty = False
+            self._last_save = time.monotonic()
+        except Exception as e:
+            logger.error(f"Failed to save search pattern statistics to {self.path}: {str(e)}")
@@ -0,0 +1,185 @@
+"""
+Background prefetch module for the Telegram bot.
+Tracks popular and recent queries and re-runs them while the bot is idle,
+so that repeated searches are answered straight from the query cache.
+"""
+
+import logging
+import asyncio
+import math
+import time
+from contextlib import asynccontextmanager
+from search_engine import search_movie, normalize_query, get_cache_age, QUERY_CACHE_TTL
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Constants
+PREFETCH_INTERVAL = 10 * 60  # seconds between prefetch rounds
+PREFETCH_TOP_N = 10  # how many top queries to refresh per round
+IDLE_THRESHOLD = 30  # seconds without interactive searches before prefetching
+RECENCY_HALF_LIFE = 24 * 60 * 60  # seconds for a query's score to halve
+MIN_PREFETCH_SCORE = 1.5  # queries searched only once never qualify, twice qualify for about 10 hours
+REFRESH_AGE = QUERY_CACHE_TTL - PREFETCH_INTERVAL  # refresh only entries that would expire before the next round
+MAX_EMPTY_BACKOFF = 8  # longest wait, in multiples of REFRESH_AGE, after prefetches that found nothing
+MAX_TRACKED_QUERIES = 500
+
+class QueryTracker:
+    """Tracks query frequency and recency and ranks queries by a decayed score."""
+
+    def __init__(self, half_life: float = RECENCY_HALF_LIFE, max_queries: int = MAX_TRACKED_QUERIES):
+        self.half_life = half_life
+        self.max_queries = max_queries
+        # normalized query -> {'query', 'count', 'last_seen', 'last_prefetched', 'empty_prefetches'}
+        self.queries: dict[str, dict] = {}
+
+    def record(self, query: str):
+        """Record that a query was searched."""
+        key = normalize_query(query)
+        entry = self.queries.get(key)
+        if entry is None:
+            if len(self.queries) >= self.max_queries:
+                # Drop the lowest scoring query to keep memory bounded
+                del self.queries[min(self.queries, key=lambda k: self.score(self.queries[k]))]
+            entry = self.queries[key] = {
+                'query': query.strip(),
+                'count': 0,
+                'last_seen': 0.0,
+                'last_prefetched': 0.0,
+                'empty_prefetches': 0,
+            }
+        entry['count'] += 1
+        entry['last_seen'] = time.time()
+
+    def get(self, query: str) -> dict | None:
+        """Get the tracking entry for a query, if it is tracked."""
+        return self.queries.get(normalize_query(query))
+
+    def score(self, entry: dict) -> float:
+        """Score a query: frequency decayed by time since it was last searched."""
+        age = max(0.0, time.time() - entry['last_seen'])
+        return entry['count'] * math.pow(0.5, age / self.half_life)
+
+    def top(self, n: int, min_score: float = 0.0) -> list[str]:
+        """Return up to n highest scoring queries whose score is at least min_score."""
+        ranked = sorted(self.queries.values(), key=self.score, reverse=True)
+        return [entry['query'] for entry in ranked[:n] if self.score(entry) >= min_score]
+
+class PrefetchCrawler:
+    """
+    Periodically re-runs top queries in the background, one at a time.
+    An interactive search cancels the background search that is in flight.
+    """
+
+    def __init__(self, interval: float = PREFETCH_INTERVAL, top_n: int = PREFETCH_TOP_N,
+                 idle_threshold: float = IDLE_THRESHOLD, min_score: float = MIN_PREFETCH_SCORE,
+                 refresh_age: float = REFRESH_AGE):
+        self.interval = interval
+        self.top_n = top_n
+        self.idle_threshold = idle_threshold
+        self.min_score = min_score
+        self.refresh_age = refresh_age
+        self.tracker = QueryTracker()
+        self._active_interactive = 0
+        self._last_interactive = 0.0
+        self._task: asyncio.Task | None = None
+        self._current: asyncio.Task | None = None
+        self._preempted = False
+
+    def record_query(self, query: str):
+        """Record an interactive query for popularity tracking."""
+        self.tracker.record(query)
+
+    @asynccontextmanager
+    async def interactive(self):
+        """Mark an interactive search as running and cancel any background search in flight."""
+        self._active_interactive += 1
+        self._last_interactive = time.monotonic()
+        if self._current is not None and not self._current.done():
+            self._preempted = True
+            self._current.cancel()
+        try:
+            yield
+        finally:
+            self._active_interactive -= 1
+            self._last_interactive = time.monotonic()
+
+    def is_idle(self) -> bool:
+        """Check whether no interactive search is running or has run recently."""
+        if self._active_interactive > 0:
+            return False
+        return time.monotonic() - self._last_interactive >= self.idle_threshold
+
+    def needs_refresh(self, query: str) -> bool:
+        """Check whether a query's cached results are missing or about to expire."""
+        entry = self.tracker.get(query)
+        # Queries without results are not cached, so also respect the last prefetch time,
+        # backing off exponentially while prefetches keep finding nothing
+        if entry:
+            backoff = min(2 ** entry['empty_prefetches'], MAX_EMPTY_BACKOFF)
+            if time.time() - entry['last_prefetched'] < self.refresh_age * backoff:
+                return False
+        age = get_cache_age(query)
+        return age is None or age >= self.refresh_age
+
+    async def prefetch_round(self) -> int:
+        """Refresh the cache for the current top queries. Returns how many were refreshed."""
+        refreshed = 0
+        for query in self.tracker.top(self.top_n, self.min_score):
+            # Yield to interactive searches before every background request
+            if not self.is_idle():
+                logger.info("Interactive search in progress, pausing prefetch round")
+                break
+            if not self.needs_refresh(query):
+                continue
+            self._preempted = False
+            self._current = asyncio.create_task(search_movie(query, use_cache=False))
+            entry = self.tracker.get(query)
+            try:
+                results = await self._current
+                refreshed += 1
+                logger.info(f"Prefetched {len(results)} results for '{query}'")
+                if entry:
+                    entry['empty_prefetches'] = 0 if results else entry['empty_prefetches'] + 1
+            except asyncio.CancelledError:
+                if not self._preempted:
+                    raise
+                logger.info(f"Prefetch of '{query}' cancelled for an interactive search")
+                break
+            except Exception as e:
+                logger.error(f"Prefetch failed for '{query}': {str(e)}")
+            finally:
+                self._current = None
+            # Cancelled prefetches are retried in the next round
+            if entry:
+                entry['last_prefetched'] = time.time()
+        return refreshed
+
+    async def run(self):
+        """Run prefetch rounds forever, waiting for idle periods."""
+        while True:
+            await asyncio.sleep(self.interval)
+            if not self.is_idle():
+                continue
+            try:
+                refreshed = await self.prefetch_round()
+                if refreshed:
+                    logger.info(f"Prefetch round refreshed {refreshed} queries")
+            except Exception as e:
+                logger.error(f"Prefetch round failed: {str(e)}")
+
+    def start(self) -> asyncio.Task:
+        """Start the background prefetch task on the running event loop."""
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self.run())
+        return self._task
+
+    async def stop(self):
+        """Cancel the background prefetch task."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
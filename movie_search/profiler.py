@@ -0,0 +1,215 @@
+"""
+Profiling module for the Telegram bot.
+Captures cProfile, tracemalloc and per-site task timings for the next N searches
+and builds a condensed report. Nothing is hooked in while profiling is off.
+"""
+
+import logging
+import cProfile
+import io
+import os
+import pstats
+import time
+import tracemalloc
+from datetime import datetime
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Constants
+PROFILE_DIR = 'profiles'
+MAX_PROFILE_SEARCHES = 20
+TOP_FUNCTIONS = 25
+TOP_ALLOCATIONS = 10
+
+# Own-time breakdown by area: (label, substrings of the file path or built-in name)
+TIME_AREAS = [
+    ('HTML parsing (bs4)', ['bs4']),
+    ('CSS selectors (soupsieve)', ['soupsieve']),
+    ('Regex matching (re)', ['/re/', '/re.py', 're.Pattern', '_sre', 'sre_']),
+    ('Network (aiohttp)', ['aiohttp', 'yarl', 'multidict']),
+    ('Network waits (select/poll)', ['selectors.py', "'select."]),
+    ('Event loop (asyncio)', ['asyncio']),
+    ('Search engine', ['search_engine.py']),
+]
+
+def classify_function(filename: str, name: str) -> str:
+    """Map a profiled function to one of the TIME_AREAS labels."""
+    location = filename.replace('\\', '/')
+    # Built-in functions have no file, the module is only visible in the name
+    if location == '~':
+        location = name
+    for label, markers in TIME_AREAS:
+        if any(marker in location for marker in markers):
+            return label
+    return 'Other'
+
+class SearchProfiler:
+    """Profiles a fixed number of upcoming searches and produces a report for the admin."""
+
+    def __init__(self, output_dir: str = PROFILE_DIR):
+        self.output_dir = output_dir
+        self.remaining = 0
+        self.chat_id = None
+        self._session_id = ''
+        self._searches: list[dict] = []
+        self._busy = False
+        self._report: tuple[str, bytes] | None = None
+
+    @property
+    def active(self) -> bool:
+        """Whether upcoming searches should be profiled."""
+        return self.remaining > 0
+
+    def enable(self, searches: int, chat_id):
+        """Start a profiling session for the next `searches` searches."""
+        self.remaining = searches
+        self.chat_id = chat_id
+        self._session_id = datetime.now().strftime('%Y%m%d_%H%M%S')
+        self._searches = []
+        self._report = None
+        logger.info(f"Profiling enabled for the next {searches} searches")
+
+    def cancel(self):
+        """Stop the current profiling session without producing a report."""
+        self.remaining = 0
+        self._searches = []
+        self._report = None
+        logger.info("Profiling cancelled")
+
+    async def profile_search(self, query: str, search_func) -> list[dict]:
+        """Run search_func(query) under cProfile and tracemalloc and record the results."""
+        # Only one cProfile profiler can be active at a time, so a search started
+        # while another one is profiled gets no profile of its own. The active
+        # profiler still captures it, like every other coroutine on the loop.
+        if self._busy or not self.active:
+            return await search_func(query)
+
+        self._busy = True
+        profiler = cProfile.Profile()
+        task_timings = {}
+        # Allocations are only traced while a profiled search runs
+        started_tracing = not tracemalloc.is_tracing()
+        if started_tracing:
+            tracemalloc.start()
+        snapshot_before = tracemalloc.take_snapshot()
+        start = time.perf_counter()
+        profiler.enable()
+        try:
+            # Bypass the query cache so the real scraping path is measured
+            results = await search_func(query, use_cache=False, task_timings=task_timings)
+        finally:
+            profiler.disable()
+            wall_time = time.perf_counter() - start
+            snapshot_after = tracemalloc.take_snapshot()
+            if started_tracing:
+                tracemalloc.stop()
+            self._busy = False
+
+        # The session may have been cancelled while the search was running
+        if not self.active:
+            return results
+
+        # Failing to write the profile must not turn a successful search into an error
+        try:
+            self._record_search(query, profiler, wall_time, task_timings, snapshot_before, snapshot_after)
+        except Exception as e:
+            logger.error(f"Failed to record profile for '{query}', cancelling profiling: {str(e)}")
+            self.cancel()
+        return results
+
+    def _record_search(self, query: str, profiler: cProfile.Profile, wall_time: float,
+                       task_timings: dict, snapshot_before, snapshot_after):
+        """Store a finished search and build the report once the session is over."""
+        os.makedirs(self.output_dir, exist_ok=True)
+        index = len(self._searches) + 1
+        stats_path = os.path.join(self.output_dir, f"search_{self._session_id}_{index}.pstats")
+        profiler.dump_stats(stats_path)
+
+        snapshot_filters = [tracemalloc.Filter(False, tracemalloc.__file__)]
+        allocations = snapshot_after.filter_traces(snapshot_filters).compare_to(
+            snapshot_before.filter_traces(snapshot_filters), 'lineno')
+
+        self._searches.append({
+            'query': query,
+            'wall_time': wall_time,
+            'task_timings': task_timings,
+            'allocations': allocations[:TOP_ALLOCATIONS],
+            'profiler': profiler,
+            'stats_path': stats_path,
+        })
+        logger.info(f"Profiled search {index} for '{query}' in {wall_time:.2f}s, stats saved to {stats_path}")
+
+        self.remaining -= 1
+        if self.remaining <= 0:
+            self._finish()
+
+    def _finish(self):
+        """Build the combined report and write it to disk."""
+        report = self.build_report()
+        report_path = os.path.join(self.output_dir, f"report_{self._session_id}.txt")
+        with open(report_path, 'w', encoding='utf-8') as f:
+            f.write(report)
+
+        combined_path = os.path.join(self.output_dir, f"combined_{self._session_id}.pstats")
+        combined = pstats.Stats(self._searches[0]['profiler'])
+        for search in self._searches[1:]:
+            combined.add(search['profiler'])
+        combined.dump_stats(combined_path)
+
+        self._report = (os.path.basename(report_path), report.encode('utf-8'))
+        self._searches = []
+        logger.info(f"Profiling session finished, report saved to {report_path}")
+
+    def build_report(self) -> str:
+        """Build a condensed text report for the searches profiled so far."""
+        lines = [
+            f"Search profile report {self._session_id}",
+            f"Searches profiled: {len(self._searches)}",
+            "Note: cProfile records everything running on the event loop during a profiled search,",
+            "including other searches, prefetching and other handlers, not only the search itself.",
+            "",
+        ]
+        if not self._searches:
+            return "\n".join(lines)
+
+        stats = pstats.Stats(self._searches[0]['profiler'])
+        for search in self._searches[1:]:
+            stats.add(search['profiler'])
+
+        # Own time per area shows where time goes: parse, selectors, regex or network
+        area_times = {}
+        for (filename, _, name), (_, _, own_time, _, _) in stats.stats.items():
+            label = classify_function(filename, name)
+            area_times[label] = area_times.get(label, 0.0) + own_time
+        lines.append("== Own time by area ==")
+        for label, seconds in sorted(area_times.items(), key=lambda item: item[1], reverse=True):
+            lines.append(f"{label:<30} {seconds:8.3f}s")
+        lines.append("")
+
+        lines.append("== Searches ==")
+        for index, search in enumerate(self._searches, 1):
+            lines.append(f"{index}. '{search['query']}' - {search['wall_time']:.2f}s wall")
+            for site_name, seconds in sorted(search['task_timings'].items(), key=lambda item: item[1], reverse=True):
+                lines.append(f"   task {site_name}: {seconds:.2f}s")
+            lines.append(f"   pstats: {search['stats_path']}")
+        lines.append("")
+
+        lines.append(f"== Top {TOP_FUNCTIONS} functions (cumulative) ==")
+        stream = io.StringIO()
+        stats.stream = stream
+        stats.strip_dirs().sort_stats('cumulative').print_stats(TOP_FUNCTIONS)
+        lines.append(stream.getvalue().strip())
+        lines.append("")
+
+        lines.append(f"== Top {TOP_ALLOCATIONS} allocations per search ==")
+        for index, search in enumerate(self._searches, 1):
+            lines.append(f"{index}. '{search['query']}'")
+            for allocation in search['allocations']:
+                lines.append(f"   {allocation}")
+        return "\n".join(lines) + "\n"
+
+    def take_report(self) -> tuple[str, bytes] | None:
+        """Return (filename, content) of a finished report once, or None if not ready."""
+        report, self._report = self._report, None
+        return report
@@ -7,9 +7,18 @@ import logging
 import aiohttp
 import asyncio
 import re
+import time
+import zlib
 from bs4 import BeautifulSoup
 from urllib.parse import quote
 from sites_config import get_enabled_sites
+from pattern_stats import PatternStats
+
+# Brotli support is optional (pip install Brotli), only advertise 'br' when it can be decoded
+try:
+    import brotli
+except ImportError:
+    brotli = None
 
 # Configure logging
 logger = logging.getLogger(__name__)
@@ -17,6 +26,51 @@ logger = logging.getLogger(__name__)
 # Constants
 REQUEST_TIMEOUT = 15  # seconds
 MAX_RETRIES = 3
+QUERY_CACHE_TTL = 30 * 60  # seconds
+QUERY_CACHE_MAX_SIZE = 200
+ACCEPT_ENCODING = 'gzip, deflate, br' if brotli else 'gzip, deflate'
+
+# Learned success statistics for search URL patterns, persisted between runs
+pattern_stats = PatternStats()
+
+# Query cache: normalized query -> (timestamp, results)
+_query_cache: dict[str, tuple[float, list[dict]]] = {}
+
+# Detected page encoding per site, so charset sniffing happens only once
+_site_encodings: dict[str, str] = {}
+
+# Search transfer statistics per site: responses, compressed and uncompressed bytes
+_bandwidth_stats: dict[str, dict[str, int]] = {}
+
+def normalize_query(query: str) -> str:
+    """Normalize a search query for use as a cache/statistics key."""
+    return ' '.join(query.lower().split())
+
+def get_cached_results(query: str) -> list[dict] | None:
+    """Return cached results for a query, or None if missing or expired."""
+    entry = _query_cache.get(normalize_query(query))
+    if entry is None:
+        return None
+    timestamp, results = entry
+    if time.monotonic() - timestamp > QUERY_CACHE_TTL:
+        return None
+    return results
+
+def get_cache_age(query: str) -> float | None:
+    """Return how many seconds ago a query was cached, or None if it is not cached."""
+    entry = _query_cache.get(normalize_query(query))
+    if entry is None:
+        return None
+    return time.monotonic() - entry[0]
+
+def cache_results(query: str, results: list[dict]):
+    """Store search results in the query cache, evicting the oldest entry when full."""
+    key = normalize_query(query)
+    _query_cache.pop(key, None)
+    if len(_query_cache) >= QUERY_CACHE_MAX_SIZE:
+        # Dicts keep insertion order, so the first key is the oldest entry
+        del _query_cache[next(iter(_query_cache))]
+    _query_cache[key] = (time.monotonic(), results)
 
 def extract_year_from_title(title: str) -> tuple[str, str]:
     """
@@ -101,19 +155,89 @@ def prepare_search_query_alternative(query: str) -> str:
     # Use different encoding approach
     return query.replace(' ', '+')
 
-async def fetch_with_retry(session: aiohttp.ClientSession, url: str, headers: dict, timeout: int = REQUEST_TIMEOUT) -> tuple[bool, str]:
-    """Fetch URL with retry logic."""
+class ContentDecodingError(Exception):
+    """Raised when a fetched response body cannot be decompressed."""
+
+def create_session() -> aiohttp.ClientSession:
+    """
+    Create an HTTP session for searching.
+    Automatic decompression is disabled so fetch_with_retry can count the bytes
+    sent over the wire and decompress the body itself.
+    """
+    return aiohttp.ClientSession(auto_decompress=False)
+
+def decompress_body(body: bytes, content_encoding: str) -> bytes:
+    """Decompress a raw response body according to its Content-Encoding header."""
+    content_encoding = content_encoding.strip().lower()
+    if not content_encoding or content_encoding == 'identity':
+        return body
+    if content_encoding in ('gzip', 'x-gzip'):
+        return zlib.decompress(body, 16 + zlib.MAX_WBITS)
+    if content_encoding == 'deflate':
+        try:
+            return zlib.decompress(body)
+        except zlib.error:
+            # Some servers send raw deflate data without the zlib header
+            return zlib.decompress(body, -zlib.MAX_WBITS)
+    if content_encoding == 'br' and brotli:
+        return brotli.decompress(body)
+    raise ValueError(f"Unsupported content encoding: {content_encoding}")
+
+def record_bandwidth(site_name: str, compressed_bytes: int, uncompressed_bytes: int):
+    """Record transferred (compressed) and decoded (uncompressed) bytes for a site."""
+    stats = _bandwidth_stats.setdefault(site_name, {'responses': 0, 'compressed_bytes': 0, 'uncompressed_bytes': 0})
+    stats['responses'] += 1
+    stats['compressed_bytes'] += compressed_bytes
+    stats['uncompressed_bytes'] += uncompressed_bytes
+
+def get_bandwidth_stats() -> dict[str, dict[str, int]]:
+    """Get transfer statistics per site."""
+    return _bandwidth_stats
+
+def get_site_encoding(site_name: str) -> str | None:
+    """Get the cached page encoding for a site, if it is known."""
+    return _site_encodings.get(site_name)
+
+def set_site_encoding(site_name: str, encoding: str | None):
+    """Cache the page encoding for a site."""
+    # Plain ASCII pages say nothing about how non-Latin titles will be encoded
+    if encoding and encoding.lower() != 'ascii':
+        _site_encodings[site_name] = encoding
+
+async def fetch_with_retry(session: aiohttp.ClientSession, url: str, headers: dict, timeout: int = REQUEST_TIMEOUT, site_name: str | None = None) -> tuple[bool, bytes]:
+    """
+    Fetch URL with retry logic and return the raw (decompressed) page bytes.
+    The session must come from create_session(). If site_name is given, search
+    transfer sizes are recorded and a charset from the Content-Type header is cached.
+    Raises ContentDecodingError without retrying if the body cannot be decompressed.
+    """
     for attempt in range(MAX_RETRIES):
         try:
             async with session.get(url, headers=headers, ssl=False, timeout=timeout) as response:
                 if response.status == 200:
-                    return True, await response.text()
+                    raw = await response.read()
+                    content_encoding = response.headers.get('Content-Encoding', '')
+                    charset = response.charset
+                    break
                 logger.warning(f"Attempt {attempt + 1} failed for {url}: Status {response.status}")
         except Exception as e:
             logger.error(f"Attempt {attempt + 1} failed for {url}: {str(e)}")
         if attempt < MAX_RETRIES - 1:
             await asyncio.sleep(1)  # Wait before retry
-    return False, ""
+    else:
+        return False, b""
+    
+    # A corrupt or unsupported body will not get better by downloading it again
+    try:
+        body = decompress_body(raw, content_encoding)
+    except Exception as e:
+        raise ContentDecodingError(f"Failed to decompress {url} ({content_encoding}): {str(e)}") from e
+    
+    if site_name:
+        record_bandwidth(site_name, len(raw), len(body))
+        if not get_site_encoding(site_name):
+            set_site_encoding(site_name, charset)
+    return True, body
 
 async def search_site(session: aiohttp.ClientSession, site_name: str, site_config: dict, query: str, headers: dict) -> list[dict]:
     """Search a single site for movies."""
@@ -131,111 +255,156 @@ async def search_site(session: aiohttp.ClientSession, site_name: str, site_confi
         search_patterns.extend(site_config['alternative_patterns'])
     
     # Try both query encoding methods
-    query_variants = [prepared_query]
+    query_variants = [('quote', prepared_query)]
     # Try alternative encoding for all sites
-    query_variants.append(prepare_search_query_alternative(query))
+    query_variants.append(('plus', prepare_search_query_alternative(query)))
+    
+    # Each candidate is a (pattern, encoding, query_variant) combination
+    candidates = [
+        (pattern, encoding, query_variant)
+        for pattern in search_patterns
+        for encoding, query_variant in query_variants
+    ]
+    # Try the combinations that worked best in the past first
+    candidates = pattern_stats.order_candidates(site_name, candidates)
+    exploring = pattern_stats.should_explore()
+    # Combinations that returned an empty page, blamed if a later one finds the title
+    empty_candidates = []
     
-    for pattern in search_patterns:
-        for query_variant in query_variants:
-            search_url = site_url + pattern.format(query=query_variant)
+    for pattern, encoding, query_variant in candidates:
+        search_url = site_url + pattern.format(query=query_variant)
+        success = False
+        started = time.perf_counter()
+        
+        try:
+            logger.info(f"Searching {site_name} ({site_url}) for '{query}' using pattern: {pattern} with query: {query_variant}")
+            success, html = await fetch_with_retry(session, search_url, headers, timeout, site_name)
             
-            try:
-                logger.info(f"Searching {site_name} ({site_url}) for '{query}' using pattern: {pattern} with query: {query_variant}")
-                success, html = await fetch_with_retry(session, search_url, headers, timeout)
+            if success:
+                # Parse the raw bytes directly; once the site's encoding is known
+                # BeautifulSoup uses it instead of sniffing the charset again
+                soup = BeautifulSoup(html, 'html.parser', from_encoding=get_site_encoding(site_name))
+                if not get_site_encoding(site_name):
+                    # Only a charset declared by the page is cached, never a guess
+                    set_site_encoding(site_name, soup.declared_html_encoding)
+                logger.debug(f"HTML content length for {site_name}: {len(html)}")
                 
-                if success:
-                    soup = BeautifulSoup(html, 'html.parser')
-                    logger.debug(f"HTML content length for {site_name}: {len(html)}")
-                    
-                    # Try to find movie items using all selectors
-                    items = []
-                    for selector in site_config['selectors']:
-                        found_items = soup.select(selector)
-                        logger.info(f"Found {len(found_items)} items matching selector '{selector}' on {site_name}")
-                        items.extend(found_items)
-                    
-                    # Also try to find any links that might contain movie URLs
-                    movie_links = soup.find_all('a', href=True)
-                    for link in movie_links:
-                        href = link.get('href', '')
-                        text = link.get_text(strip=True)
-                        # More lenient - include any link with text that might be a movie title
-                        if (any(keyword in href.lower() for keyword in ['/film/', '/serial/', '/movie/', '/video/']) or
-                            (text and len(text) > 2 and not text.isdigit() and not text.startswith('http'))):
-                            items.append(link)
-                    
-                    # Remove duplicates while preserving order
-                    seen_items = set()
-                    unique_items = []
-                    for item in items:
-                        item_str = str(item)
-                        if item_str not in seen_items:
-                            seen_items.add(item_str)
-                            unique_items.append(item)
+                # Try to find movie items using all selectors
+                items = []
+                for selector in site_config['selectors']:
+                    found_items = soup.select(selector)
+                    logger.info(f"Found {len(found_items)} items matching selector '{selector}' on {site_name}")
+                    items.extend(found_items)
+                
+                # Also try to find any links that might contain movie URLs
+                movie_links = soup.find_all('a', href=True)
+                for link in movie_links:
+                    href = link.get('href', '')
+                    text = link.get_text(strip=True)
+                    # More lenient - include any link with text that might be a movie title
+                    if (any(keyword in href.lower() for keyword in ['/film/', '/serial/', '/movie/', '/video/']) or
+                        (text and len(text) > 2 and not text.isdigit() and not text.startswith('http'))):
+                        items.append(link)
+                
+                # Remove duplicates while preserving order
+                seen_items = set()
+                unique_items = []
+                for item in items:
+                    item_str = str(item)
+                    if item_str not in seen_items:
+                        seen_items.add(item_str)
+                        unique_items.append(item)
+                
+                # Process found items
+                for item in unique_items:
+                    # Try different ways to get title and URL
+                    link = item
+                    if item.name != 'a':
+                        link = item.find('a')
+                        if not link:
+                            link = item.parent.find('a') if item.parent else None
                     
-                    # Process found items
-                    for item in unique_items:
-                        # Try different ways to get title and URL
-                        link = item
-                        if item.name != 'a':
-                            link = item.find('a')
-                            if not link:
-                                link = item.parent.find('a') if item.parent else None
+                    if link and link.name == 'a':
+                        title = (link.get('title', '') or 
+                                link.text.strip() or 
+                                item.get_text(strip=True))
+                        url = link.get('href', '')
                         
-                        if link and link.name == 'a':
-                            title = (link.get('title', '') or 
-                                    link.text.strip() or 
-                                    item.get_text(strip=True))
-                            url = link.get('href', '')
+                        if title and url and len(title.strip()) > 2:
+                            # STRICT MATCHING: Only include results with exact title match
+                            if not is_exact_title_match(query, title):
+                                continue  # Skip this result
                             
-                            if title and url and len(title.strip()) > 2:
-                                # STRICT MATCHING: Only include results with exact title match
-                                if not is_exact_title_match(query, title):
-                                    continue  # Skip this result
-                                
-                                if not url.startswith('http'):
-                                    url = site_url + ('/' if not url.startswith('/') else '') + url
-                                
-                                # Extract year from title
-                                clean_title, year = extract_year_from_title(title)
-                                
-                                result = {
-                                    'title': clean_title,
-                                    'year': year,
-                                    'url': url,
-                                    'site': site_name,
-                                    'site_url': site_url,
-                                    'original_title': title  # Keep original for reference
-                                }
-                                
-                                # Check if this result is not already in results
-                                is_duplicate = any(r['url'] == result['url'] for r in results)
-                                if not is_duplicate:
-                                    results.append(result)
-                                    logger.info(f"Found exact match on {site_name}: {clean_title} ({year})")
-                    
-                    # If we found results with this pattern, break out of the pattern loop
-                    if results:
-                        break
-                else:
-                    logger.warning(f"Failed to fetch content from {site_name} with pattern: {pattern}")
-                    
-            except Exception as e:
-                logger.error(f"Error searching {site_name} with pattern {pattern}: {str(e)}")
-                continue  # Try next pattern
+                            if not url.startswith('http'):
+                                url = site_url + ('/' if not url.startswith('/') else '') + url
+                            
+                            # Extract year from title
+                            clean_title, year = extract_year_from_title(title)
+                            
+                            result = {
+                                'title': clean_title,
+                                'year': year,
+                                'url': url,
+                                'site': site_name,
+                                'site_url': site_url,
+                                'original_title': title  # Keep original for reference
+                            }
+                            
+                            # Check if this result is not already in results
+                            is_duplicate = any(r['url'] == result['url'] for r in results)
+                            if not is_duplicate:
+                                results.append(result)
+                                logger.info(f"Found exact match on {site_name}: {clean_title} ({year})")
+            else:
+                logger.warning(f"Failed to fetch content from {site_name} with pattern: {pattern}")
+                
+        except ContentDecodingError as e:
+            # The URL answered, only its body was unusable, so the variant is not blamed
+            logger.error(f"Error searching {site_name} with pattern {pattern}: {str(e)}")
+            continue
+        except Exception as e:
+            logger.error(f"Error searching {site_name} with pattern {pattern}: {str(e)}")
+        
+        pattern_stats.record(site_name, pattern, encoding, success, len(results), time.perf_counter() - started)
         
-        # If we found results, break out of the pattern loop
         if results:
+            for empty_pattern, empty_encoding in empty_candidates:
+                pattern_stats.record_miss(site_name, empty_pattern, empty_encoding)
+        elif success:
+            empty_candidates.append((pattern, encoding))
+        
+        # Stop on results, or on an empty answer from a proven combination
+        if pattern_stats.should_stop(site_name, pattern, encoding, success, len(results), exploring):
             break
     
     return results[:max_results]  # Return only top results
 
-async def search_movie(query: str) -> list[dict]:
-    """Search for movies across all enabled sites."""
+async def timed_task(coro, name: str, task_timings: dict):
+    """Await a coroutine and record its wall-clock duration under the given name."""
+    start = time.perf_counter()
+    try:
+        return await coro
+    finally:
+        task_timings[name] = time.perf_counter() - start
+
+async def search_movie(query: str, use_cache: bool = True, task_timings: dict | None = None) -> list[dict]:
+    """
+    Search for movies across all enabled sites.
+    Fresh non-empty results are stored in the query cache; use_cache=False
+    skips the cache lookup and forces the sites to be scraped again.
+    If task_timings is given, the duration of each site task is recorded in it.
+    """
+    if use_cache:
+        cached = get_cached_results(query)
+        if cached is not None:
+            logger.info(f"Returning {len(cached)} cached results for '{query}'")
+            return cached
+    
     headers = {
         'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
         'Accept-Language': 'ru-RU,ru;q=0.9,en-US;q=0.8,en;q=0.7',
         'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,image/apng,*/*;q=0.8',
+        'Accept-Encoding': ACCEPT_ENCODING,
         'Connection': 'keep-alive',
         'Cache-Control': 'no-cache',
         'Pragma': 'no-cache',
@@ -247,10 +416,13 @@ async def search_movie(query: str) -> list[dict]:
     enabled_sites = get_enabled_sites()
     logger.info(f"Searching across {len(enabled_sites)} enabled sites: {list(enabled_sites.keys())}")
     
-    async with aiohttp.ClientSession() as session:
+    async with create_session() as session:
         tasks = []
         for site_name, site_config in enabled_sites.items():
-            tasks.append(search_site(session, site_name, site_config, query, headers))
+            task = search_site(session, site_name, site_config, query, headers)
+            if task_timings is not None:
+                task = timed_task(task, site_name, task_timings)
+            tasks.append(task)
         
         results = []
         for completed_task in await asyncio.gather(*tasks, return_exceptions=True):
@@ -259,6 +431,8 @@ async def search_movie(query: str) -> list[dict]:
             elif isinstance(completed_task, Exception):
                 logger.error(f"Task failed with exception: {completed_task}")
     
+    pattern_stats.save()
+    
     # Remove duplicates while preserving order
     seen = set()
     unique_results = []
@@ -268,18 +442,22 @@ async def search_movie(query: str) -> list[dict]:
             unique_results.append(result)
     
     logger.info(f"Found {len(unique_results)} unique exact matches for '{query}' across all sites")
+    # Empty results may come from a temporary network failure, so they are not cached
+    if unique_results:
+        cache_results(query, unique_results)
     return unique_results
 
 async def test_site_connectivity():
     """Test connectivity to all enabled sites."""
     headers = {
-        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36'
+        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
+        'Accept-Encoding': ACCEPT_ENCODING
     }
     
     enabled_sites = get_enabled_sites()
     results = {}
     
-    async with aiohttp.ClientSession() as session:
+    async with create_session() as session:
         for site_name, site_config in enabled_sites.items():
             try:
                 success, _ = await fetch_with_retry(session, site_config['url'], headers, 10)
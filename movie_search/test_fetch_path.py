@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""
+Test script for the fetch path: decompression, encoding cache and retries.
+"""
+
+import asyncio
+import gzip
+import zlib
+import search_engine
+from search_engine import (decompress_body, fetch_with_retry, get_site_encoding, set_site_encoding,
+                           get_bandwidth_stats, ContentDecodingError, MAX_RETRIES)
+
+PAGE = 'Главы государств (2023)'.encode('windows-1251') * 20
+
+class FakeResponse:
+    """Minimal stand-in for an aiohttp response."""
+
+    def __init__(self, status: int, body: bytes = b"", content_encoding: str = '', charset: str | None = None):
+        self.status = status
+        self.body = body
+        self.headers = {'Content-Encoding': content_encoding} if content_encoding else {}
+        self.charset = charset
+
+    async def read(self) -> bytes:
+        return self.body
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        return False
+
+class FakeSession:
+    """Session returning prepared responses in order and counting requests."""
+
+    def __init__(self, responses: list[FakeResponse]):
+        self.responses = responses
+        self.requests = 0
+
+    def get(self, url: str, **kwargs) -> FakeResponse:
+        self.requests += 1
+        return self.responses.pop(0)
+
+def test_decompress_body():
+    """gzip, zlib and raw deflate bodies are decoded, unknown or stacked encodings raise ValueError."""
+    print("🧪 Testing body decompression")
+    assert decompress_body(PAGE, '') == PAGE
+    assert decompress_body(PAGE, 'identity') == PAGE
+    assert decompress_body(gzip.compress(PAGE), 'gzip') == PAGE
+    assert decompress_body(gzip.compress(PAGE), 'X-GZIP ') == PAGE
+    assert decompress_body(zlib.compress(PAGE), 'deflate') == PAGE
+
+    raw_deflate = zlib.compressobj(wbits=-zlib.MAX_WBITS)
+    assert decompress_body(raw_deflate.compress(PAGE) + raw_deflate.flush(), 'deflate') == PAGE
+
+    for content_encoding in ['compress', 'gzip, br', 'zstd']:
+        try:
+            decompress_body(PAGE, content_encoding)
+        except ValueError:
+            continue
+        raise AssertionError(f"'{content_encoding}' should not be accepted")
+    print("✅ Body decompression works")
+
+def test_site_encoding_cache():
+    """Missing encodings and plain ASCII are not cached, real encodings are."""
+    print("🧪 Testing site encoding cache")
+    site_name = 'encoding-test.example'
+    set_site_encoding(site_name, None)
+    set_site_encoding(site_name, 'ascii')
+    set_site_encoding(site_name, 'ASCII')
+    assert get_site_encoding(site_name) is None
+
+    set_site_encoding(site_name, 'windows-1251')
+    assert get_site_encoding(site_name) == 'windows-1251'
+    search_engine._site_encodings.pop(site_name, None)
+    print("✅ Site encoding cache works")
+
+def test_fetch_retries_and_bad_bodies():
+    """HTTP errors are retried, a body that fails to decompress is not."""
+    print("🧪 Testing fetch retries")
+    site_name = 'fetch-test.example'
+    try:
+        session = FakeSession([FakeResponse(404), FakeResponse(200, gzip.compress(PAGE), 'gzip', 'windows-1251')])
+        success, body = asyncio.run(fetch_with_retry(session, 'https://fetch-test.example/', {}, 1, site_name))
+        assert success and body == PAGE and session.requests == 2
+        stats = get_bandwidth_stats()[site_name]
+        assert stats['compressed_bytes'] < stats['uncompressed_bytes'] == len(PAGE)
+        assert get_site_encoding(site_name) == 'windows-1251'
+
+        session = FakeSession([FakeResponse(200, b'not gzip at all', 'gzip')] * MAX_RETRIES)
+        try:
+            asyncio.run(fetch_with_retry(session, 'https://fetch-test.example/', {}, 1, site_name))
+        except ContentDecodingError:
+            pass
+        else:
+            raise AssertionError("a corrupt body should raise ContentDecodingError")
+        assert session.requests == 1
+
+        session = FakeSession([FakeResponse(500)] * MAX_RETRIES)
+        assert asyncio.run(fetch_with_retry(session, 'https://fetch-test.example/', {}, 1)) == (False, b"")
+        assert session.requests == MAX_RETRIES
+    finally:
+        search_engine._site_encodings.pop(site_name, None)
+        search_engine._bandwidth_stats.pop(site_name, None)
+    print("✅ Fetch retries work")
+
+if __name__ == "__main__":
+    test_decompress_body()
+    test_site_encoding_cache()
+    test_fetch_retries_and_bad_bodies()
@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+"""
+Test script for search pattern statistics: ranking, pruning, trust, drift and persistence.
+"""
+
+import os
+import random
+import tempfile
+from pattern_stats import PatternStats, PRUNE_AFTER_FAILURES, TRUSTED_MIN_HITS, EXPLORATION_RATE
+
+SITE = 'kinogo.uk'
+PATTERNS = ['/search/?q={query}', '/?s={query}', '/search/{query}']
+ENCODINGS = ['quote', 'plus']
+
+def make_stats(directory: str, explore: bool = False) -> PatternStats:
+    """Create statistics stored in a temporary directory with deterministic exploration."""
+    stats = PatternStats(os.path.join(directory, 'pattern_stats.json'))
+    stats.should_explore = lambda: explore
+    return stats
+
+def make_candidates() -> list[tuple[str, str, str]]:
+    """Build (pattern, encoding, query_variant) candidates in configuration order."""
+    return [(pattern, encoding, 'query') for pattern in PATTERNS for encoding in ENCODINGS]
+
+def simulate_search(stats: PatternStats, working: set, title_exists: bool = True) -> bool:
+    """
+    Run the search_site candidate loop against fake mirrors that always answer 200.
+    Only combinations in `working` list the title. Returns True when results were found.
+    """
+    exploring = stats.should_explore()
+    empty_candidates = []
+    for pattern, encoding, _ in stats.order_candidates(SITE, make_candidates()):
+        result_count = 1 if title_exists and (pattern, encoding) in working else 0
+        stats.record(SITE, pattern, encoding, True, result_count, 0.5)
+        if result_count:
+            for empty_pattern, empty_encoding in empty_candidates:
+                stats.record_miss(SITE, empty_pattern, empty_encoding)
+        else:
+            empty_candidates.append((pattern, encoding))
+        if stats.should_stop(SITE, pattern, encoding, True, result_count, exploring):
+            return result_count > 0
+    return False
+
+def test_empty_page_vs_404():
+    """Empty pages only count against variants when another variant on the site has hits."""
+    print("🧪 Testing empty page vs 404 handling")
+    with tempfile.TemporaryDirectory() as directory:
+        stats = make_stats(directory)
+
+        # Titles missing on a reachable site must not prune anything
+        for _ in range(PRUNE_AFTER_FAILURES * 2):
+            for pattern, encoding, _ in make_candidates():
+                stats.record(SITE, pattern, encoding, True, 0, 0.5)
+        assert not any(stats.is_pruned(stats.get(SITE, p, e)) for p, e, _ in make_candidates())
+        assert len(stats.order_candidates(SITE, make_candidates())) == len(make_candidates())
+
+        # Repeated fetch failures prune a variant
+        for _ in range(PRUNE_AFTER_FAILURES):
+            stats.record(SITE, PATTERNS[0], 'quote', False, 0, 1.0)
+        assert stats.is_pruned(stats.get(SITE, PATTERNS[0], 'quote'))
+
+        # Once a variant finds titles, empty pages from variants without hits count against them
+        stats.record(SITE, PATTERNS[1], 'plus', True, 2, 0.5)
+        for _ in range(PRUNE_AFTER_FAILURES):
+            stats.record(SITE, PATTERNS[2], 'quote', True, 0, 0.5)
+        assert stats.is_pruned(stats.get(SITE, PATTERNS[2], 'quote'))
+
+        # The variant with hits is never pruned by empty pages
+        for _ in range(PRUNE_AFTER_FAILURES):
+            stats.record(SITE, PATTERNS[1], 'plus', True, 0, 0.5)
+        assert not stats.is_pruned(stats.get(SITE, PATTERNS[1], 'plus'))
+    print("✅ Empty page vs 404 handling works")
+
+def test_candidate_ordering():
+    """Variants with hits come first, failing variants last, ties keep configuration order."""
+    print("🧪 Testing candidate ordering")
+    with tempfile.TemporaryDirectory() as directory:
+        stats = make_stats(directory)
+        candidates = make_candidates()
+
+        # Without statistics the configuration order is kept
+        assert stats.order_candidates(SITE, candidates) == candidates
+
+        stats.record(SITE, PATTERNS[2], 'plus', True, 3, 0.4)
+        stats.record(SITE, PATTERNS[0], 'quote', False, 0, 1.0)
+        ordered = stats.order_candidates(SITE, candidates)
+        assert ordered[0] == (PATTERNS[2], 'plus', 'query')
+        assert ordered[-1] == (PATTERNS[0], 'quote', 'query')
+        assert ordered[1] == (PATTERNS[0], 'plus', 'query')
+
+        # Between variants with hits the one with the higher recent hit rate wins
+        stats.record(SITE, PATTERNS[1], 'quote', True, 1, 0.2)
+        stats.record(SITE, PATTERNS[1], 'quote', True, 1, 0.2)
+        stats.record(SITE, PATTERNS[2], 'plus', False, 0, 1.0)
+        assert stats.order_candidates(SITE, candidates)[0] == (PATTERNS[1], 'quote', 'query')
+    print("✅ Candidate ordering works")
+
+def test_all_pruned_fallback():
+    """Pruning never leaves a site without candidates, exploration re-adds pruned ones."""
+    print("🧪 Testing all-pruned fallback")
+    with tempfile.TemporaryDirectory() as directory:
+        stats = make_stats(directory)
+        candidates = make_candidates()
+        for _ in range(PRUNE_AFTER_FAILURES):
+            for pattern, encoding, _ in candidates:
+                stats.record(SITE, pattern, encoding, False, 0, 1.0)
+        assert sorted(stats.order_candidates(SITE, candidates)) == sorted(candidates)
+
+        # With one working variant the pruned ones are skipped unless exploring
+        stats.record(SITE, PATTERNS[1], 'plus', True, 1, 0.5)
+        assert stats.order_candidates(SITE, candidates) == [(PATTERNS[1], 'plus', 'query')]
+        stats.should_explore = lambda: True
+        assert len(stats.order_candidates(SITE, candidates)) == len(candidates)
+    print("✅ All-pruned fallback works")
+
+def test_drift_to_new_search_url():
+    """A mirror whose old search URL keeps answering 200 with no matches is relearned."""
+    print("🧪 Testing drift to a new search URL")
+    with tempfile.TemporaryDirectory() as directory:
+        stats = make_stats(directory)
+        rng = random.Random(1)
+        stats.should_explore = lambda: rng.random() < EXPLORATION_RATE
+        old_variant = (PATTERNS[0], 'quote')
+        new_variant = (PATTERNS[2], 'plus')
+
+        for _ in range(30):
+            assert simulate_search(stats, {old_variant})
+        assert stats.is_trusted(SITE, *old_variant)
+
+        # The mirror moves its search; the old URL now returns an empty 200 page
+        found = [simulate_search(stats, {new_variant}) for _ in range(100)]
+        # Exploration finds the new variant, after which every search succeeds
+        assert True in found
+        assert all(found[found.index(True):])
+        assert not stats.is_trusted(SITE, *old_variant)
+        assert stats.order_candidates(SITE, make_candidates())[0] == (*new_variant, 'query')
+
+        # Titles missing from the mirror do not make the new variant lose trust
+        for _ in range(20):
+            assert not simulate_search(stats, {new_variant}, title_exists=False)
+        assert stats.is_trusted(SITE, *new_variant)
+    print("✅ Drift to a new search URL works")
+
+def test_lookup_does_not_store():
+    """Looking at candidates stores nothing, stale configuration entries are dropped."""
+    print("🧪 Testing read-only lookups")
+    with tempfile.TemporaryDirectory() as directory:
+        stats = make_stats(directory)
+        stats.order_candidates(SITE, make_candidates())
+        stats.is_trusted(SITE, PATTERNS[0], 'quote')
+        assert stats.stats.get(SITE, {}) == {}
+
+        stats.record(SITE, '/removed/{query}', 'quote', True, 1, 0.5)
+        stats.record(SITE, PATTERNS[0], 'quote', True, 1, 0.5)
+        stats.order_candidates(SITE, make_candidates())
+        assert list(stats.stats[SITE]) == [stats.make_key(PATTERNS[0], 'quote')]
+    print("✅ Read-only lookups work")
+
+def test_trusted_after_transient_failure():
+    """A proven variant loses trust on a failed fetch and regains it on the next fetch."""
+    print("🧪 Testing trust after a transient failure")
+    with tempfile.TemporaryDirectory() as directory:
+        stats = make_stats(directory)
+        for _ in range(TRUSTED_MIN_HITS):
+            stats.record(SITE, PATTERNS[0], 'quote', True, 1, 0.5)
+        assert stats.is_trusted(SITE, PATTERNS[0], 'quote')
+
+        stats.record(SITE, PATTERNS[0], 'quote', False, 0, 1.0)
+        assert not stats.is_trusted(SITE, PATTERNS[0], 'quote')
+
+        # A fetched page without the title proves the variant works again
+        stats.record(SITE, PATTERNS[0], 'quote', True, 0, 0.5)
+        assert stats.is_trusted(SITE, PATTERNS[0], 'quote')
+    print("✅ Trust after a transient failure works")
+
+def test_save_load_round_trip():
+    """Statistics survive a save and load through the JSON file."""
+    print("🧪 Testing save/load round-trip")
+    with tempfile.TemporaryDirectory() as directory:
+        stats = make_stats(directory)
+        stats.record(SITE, PATTERNS[0], 'quote', True, 2, 0.5)
+        stats.record(SITE, PATTERNS[1], 'plus', False, 0, 1.5)
+        stats.save(force=True)
+
+        loaded = make_stats(directory)
+        assert loaded.stats == stats.stats
+        assert loaded.get(SITE, PATTERNS[0], 'quote')['hits'] == 1
+
+        # Throttled saves skip writing until the interval has passed
+        stats.record(SITE, PATTERNS[0], 'quote', True, 1, 0.5)
+        stats.save()
+        assert make_stats(directory).get(SITE, PATTERNS[0], 'quote')['hits'] == 1
+    print("✅ Save/load round-trip works")
+
+if __name__ == "__main__":
+    test_empty_page_vs_404()
+    test_candidate_ordering()
+    test_all_pruned_fallback()
+    test_drift_to_new_search_url()
+    test_lookup_does_not_store()
+    test_trusted_after_transient_failure()
+    test_save_load_round_trip()